@@ -6,67 +6,90 @@
 # Last Modified: 2022-05-23
 
 import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
 import networkx as nx
+import xlsxwriter
 import network_cards as nc
 
+SEED = 20220523 # templates are reproducible
+random.seed(SEED)
+rng = np.random.default_rng(SEED)
 
-def save_template_excel(graph, filename, updates=None):
-    card = nc.NetworkCard(graph)
-    card.clear(keep_notes=True)
-    if updates is not None:
-        card.update_structure(*updates)
-    card.to_excel(filename+".xlsx")
+
+def add_random_weights(graph, low=0, high=10):
+    """Give every link a random integer weight in [low, high]."""
+    edges = list(graph.edges())
+    weights = rng.integers(low, high+1, size=len(edges)).tolist()
+    nx.set_edge_attributes(graph, dict(zip(edges, weights)), 'weight')
 
 
-def save_template_latex(graph, filename, updates=None):
+def template_card(graph, updates=None):
     card = nc.NetworkCard(graph)
     card.clear(keep_notes=True)
     if updates is not None:
         card.update_structure(*updates)
+    return card
+
+
+def save_template_excel(card, filename):
+    with xlsxwriter.Workbook(filename+".xlsx", {'constant_memory': True}) as workbook:
+        card.write_to_xlsxwriter(workbook)
+
+
+def save_template_latex(card, filename):
     card.to_latex(filename+".tex")
 
 
-for connected in ['connected', 'unconnected']:
-    p = 0.24 if connected == 'connected' else 0.01
-
-    updates = ("Diameter", "n/a") if connected == 'unconnected' else None
-
-    # undirected, unweighted:   
-    G = nx.erdos_renyi_graph(100,p)
-    if connected == 'connected':
-        assert nx.is_connected(G) == True
-    else:
-        assert nx.is_connected(G) == False
-
-    for st in [save_template_excel, save_template_latex]:
-        st(G, f"../templates/undirected_unweighted_{connected}",
-           updates=updates)
-
-    # undirected, weighted:
-    G = nx.erdos_renyi_graph(100,p)
-    for (u, v) in G.edges():
-        G.edges[u,v]['weight'] = random.randint(0,10)
-    if connected == 'connected':
-        assert nx.is_connected(G) is True
-    else:
-        assert nx.is_connected(G) is False
-
-    for st in [save_template_excel, save_template_latex]:
-        st(G, f"../templates/undirected_weighted_{connected}",
-           updates=updates)
-
-# directed, unweighted:
-D = nx.DiGraph()
-D.add_edge(0,1)
-D.add_edge(0,2)
-D.add_edge(2,3)
-D.add_edge(3,2)
-for st in [save_template_excel, save_template_latex]:
-    st(D, "../templates/directed_unweighted")
-
-# directed, weighted:
-for (u, v) in D.edges():
-    D.edges[u,v]['weight'] = random.randint(0,10)
-for st in [save_template_excel, save_template_latex]:
-    st(D, "../templates/directed_weighted")
+def main():
+    savers = [save_template_excel, save_template_latex]
+
+    # template files are independent, write them in parallel as each card is
+    # ready (files already submitted still get written if a later card fails):
+    with ProcessPoolExecutor() as executor:
+        futures = []
+
+        def submit(card, filename):
+            futures.extend(executor.submit(st, card, filename) for st in savers)
+
+        for connected in ['connected', 'unconnected']:
+            p = 0.24 if connected == 'connected' else 0.01
+
+            updates = ("Diameter", "n/a") if connected == 'unconnected' else None
+
+            # undirected, unweighted (redraw until connectivity matches):
+            G = nx.fast_gnp_random_graph(100,p, seed=random)
+            while nx.is_connected(G) != (connected == 'connected'):
+                G = nx.fast_gnp_random_graph(100,p, seed=random)
+
+            card = template_card(G, updates=updates)
+            submit(card, f"../templates/undirected_unweighted_{connected}")
+
+            # undirected, weighted (same graph, so same connectivity):
+            G = G.copy()
+            add_random_weights(G)
+
+            card = template_card(G, updates=updates)
+            submit(card, f"../templates/undirected_weighted_{connected}")
+
+        # directed, unweighted:
+        D = nx.DiGraph()
+        D.add_edge(0,1)
+        D.add_edge(0,2)
+        D.add_edge(2,3)
+        D.add_edge(3,2)
+        card = template_card(D)
+        submit(card, "../templates/directed_unweighted")
+
+        # directed, weighted:
+        D = D.copy()
+        add_random_weights(D)
+        card = template_card(D)
+        submit(card, "../templates/directed_weighted")
+
+        for future in as_completed(futures):
+            future.result() # raise any write error
+
 
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,3 @@
-__all__ = ["NetworkCard", "NetworkMultiCard", "read_json"]
+__all__ = ["NetworkCard", "NetworkMultiCard", "read_json", "read_binary"]
 
-from .network_cards import NetworkCard, NetworkMultiCard, read_json
+from .network_cards import NetworkCard, NetworkMultiCard, read_json, read_binary
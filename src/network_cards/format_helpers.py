@@ -5,9 +5,43 @@
 # Jim Bagrow
 # Last Modified: 2022-04-19
 
-import re
+import os
 
-from pandas.io.formats.format import save_to_buffer
+
+def save_to_buffer(string, buf=None, encoding="utf-8"):
+    """Write `string` to `buf`, a file name or an object with a write method,
+    or return it if buf is None. Mirrors pandas' (private) helper of the same
+    name without importing pandas. Bytes are written to files in binary mode.
+    """
+    if buf is None:
+        return string
+    if hasattr(buf, "write"):
+        buf.write(string)
+    elif isinstance(string, bytes):
+        with open(os.fspath(buf), "wb") as f:
+            f.write(string)
+    else:
+        with open(os.fspath(buf), "w", encoding=encoding, newline="") as f:
+            f.write(string)
+
+
+# https://stackoverflow.com/a/25875504
+_TEX_CONV = {
+    '&': r'\&',
+    '%': r'\%',
+    '$': r'\$',
+    '#': r'\#',
+    '_': r'\_',
+    '{': r'\{',
+    '}': r'\}',
+    '~': r'\textasciitilde{}',
+    '^': r'\^{}',
+    '\\': r'\textbackslash{}',
+    '<': r'\textless{}',
+    '>': r'\textgreater{}',
+}
+_TEX_TRANSLATE = {ord(key): val for key, val in _TEX_CONV.items()} # all keys are single chars
+_TEX_SPECIALS = frozenset(_TEX_CONV)
 
 
 def tex_escape(text):
@@ -15,244 +49,133 @@ def tex_escape(text):
         :param text: a plain text message
         :return: the message escaped to appear correctly in LaTeX
     """
-    # https://stackoverflow.com/a/25875504
-    conv = {
-        '&': r'\&',
-        '%': r'\%',
-        '$': r'\$',
-        '#': r'\#',
-        '_': r'\_',
-        '{': r'\{',
-        '}': r'\}',
-        '~': r'\textasciitilde{}',
-        '^': r'\^{}',
-        '\\': r'\textbackslash{}',
-        '<': r'\textless{}',
-        '>': r'\textgreater{}',
-    }
     if isinstance(text, (int, float)):
         return text#"{:g}".format(text)
     text = str(text)
-    regex = re.compile('|'.join(re.escape(str(key)) for key in sorted(conv.keys(), key = lambda item: - len(item))))
-    return regex.sub(lambda match: conv[match.group()], text)
+    if _TEX_SPECIALS.isdisjoint(text): # most entries need no escaping
+        return text
+    return text.translate(_TEX_TRANSLATE)
 
 
 
-def draw_frame_border(
-    workbook, worksheet, first_row, first_col, rows_count, cols_count, thickness=1
-):
+def _fmt(workbook, spec):
+    """Return a workbook format for `spec`, reusing one already made for an
+    identical spec on this workbook.
+    """
+    try:
+        cache = workbook._fmt_cache
+    except AttributeError:
+        cache = workbook._fmt_cache = {}
+    key = tuple(sorted(spec.items()))
+    try:
+        return cache[key]
+    except KeyError:
+        return cache.setdefault(key, workbook.add_format(spec))
+
+
+# sides bordered by each piece of a frame, see _frame_parts:
+_BORDER_SIDES = {
+    'box':        ("top", "bottom", "left", "right"),
+    'left cap':   ("top", "left", "bottom"),
+    'top+bottom': ("top", "bottom"),
+    'right cap':  ("top", "right", "bottom"),
+    'top cap':    ("top", "left", "right"),
+    'left+right': ("left", "right"),
+    'bottom cap': ("bottom", "left", "right"),
+    'top left':     ("top", "left"),
+    'top right':    ("top", "right"),
+    'bottom left':  ("bottom", "left"),
+    'bottom right': ("bottom", "right"),
+    'top':    ("top",),
+    'left':   ("left",),
+    'bottom': ("bottom",),
+    'right':  ("right",),
+}
+
+
+def _border_spec(piece, thickness=1):
+    """Format properties for a frame piece, e.g. {"top": 1, "left": 1}."""
+    return dict.fromkeys(_BORDER_SIDES[piece], thickness)
+
+
+def _parts_box(first_row, first_col, last_row, last_col):
+    """Frame pieces for a single cell."""
+    return [(first_row, first_col, first_row, first_col, 'box')]
+
+
+def _parts_row(first_row, first_col, last_row, last_col):
+    """Frame pieces for a single row."""
+    return [
+        (first_row, first_col, first_row, first_col, 'left cap'),
+        (first_row, first_col + 1, first_row, last_col - 1, 'top+bottom'),
+        (first_row, last_col, first_row, last_col, 'right cap'),
+    ]
+
+
+def _parts_col(first_row, first_col, last_row, last_col):
+    """Frame pieces for a single column."""
+    return [
+        (first_row, first_col, first_row, first_col, 'top cap'),
+        (first_row + 1, first_col, last_row - 1, first_col, 'left+right'),
+        (last_row, first_col, last_row, first_col, 'bottom cap'),
+    ]
+
+
+def _parts_rect(first_row, first_col, last_row, last_col):
+    """Frame pieces for a block at least 2 rows tall and 2 columns wide."""
+    return [
+        (first_row, first_col, first_row, first_col, 'top left'),
+        (first_row, last_col, first_row, last_col, 'top right'),
+        (last_row, first_col, last_row, first_col, 'bottom left'),
+        (last_row, last_col, last_row, last_col, 'bottom right'),
+        # sides are empty when the frame is 2 wide/tall
+        (first_row, first_col + 1, first_row, last_col - 1, 'top'),
+        (first_row + 1, first_col, last_row - 1, first_col, 'left'),
+        (last_row, first_col + 1, last_row, last_col - 1, 'bottom'),
+        (first_row + 1, last_col, last_row - 1, last_col, 'right'),
+    ]
+
+
+# (rows_count == 1, cols_count == 1) -> pieces for that shape of frame
+_FRAME_PARTS = {
+    (True, True): _parts_box,
+    (True, False): _parts_row,
+    (False, True): _parts_col,
+    (False, False): _parts_rect,
+}
+
+
+def _frame_parts(first_row, first_col, rows_count, cols_count):
+    """List the (first_row, first_col, last_row, last_col, piece) regions that
+    make up a frame, where piece names the bordered sides in _BORDER_SIDES.
+    Empty frames and regions are left out, since xlsxwriter would otherwise
+    swap the endpoints and border the wrong cells.
+    """
     # https://stackoverflow.com/a/60476284
-
-    if cols_count == 1 and rows_count == 1:
-        # whole cell
-        worksheet.conditional_format(
-            first_row,
-            first_col,
-            first_row,
-            first_col,
-            {
-                "type": "formula",
-                "criteria": "True",
-                "format": workbook.add_format(
-                    {
-                        "top": thickness,
-                        "bottom": thickness,
-                        "left": thickness,
-                        "right": thickness,
-                    }
-                ),
-            },
-        )
-    elif rows_count == 1:
-        # left cap
-        worksheet.conditional_format(
-            first_row,
-            first_col,
-            first_row,
-            first_col,
-            {
-                "type": "formula",
-                "criteria": "True",
-                "format": workbook.add_format(
-                    {"top": thickness, "left": thickness, "bottom": thickness}
-                ),
-            },
-        )
-        # top and bottom sides
-        worksheet.conditional_format(
-            first_row,
-            first_col + 1,
-            first_row,
-            first_col + cols_count - 2,
-            {
-                "type": "formula",
-                "criteria": "True",
-                "format": workbook.add_format({"top": thickness, "bottom": thickness}),
-            },
-        )
-
-        # right cap
-        worksheet.conditional_format(
-            first_row,
-            first_col + cols_count - 1,
-            first_row,
-            first_col + cols_count - 1,
-            {
-                "type": "formula",
-                "criteria": "True",
-                "format": workbook.add_format(
-                    {"top": thickness, "right": thickness, "bottom": thickness}
-                ),
-            },
-        )
-
-    elif cols_count == 1:
-        # top cap
-        worksheet.conditional_format(
-            first_row,
-            first_col,
-            first_row,
-            first_col,
-            {
-                "type": "formula",
-                "criteria": "True",
-                "format": workbook.add_format(
-                    {"top": thickness, "left": thickness, "right": thickness}
-                ),
-            },
-        )
-
-        # left and right sides
-        worksheet.conditional_format(
-            first_row + 1,
-            first_col,
-            first_row + rows_count - 2,
-            first_col,
-            {
-                "type": "formula",
-                "criteria": "True",
-                "format": workbook.add_format({"left": thickness, "right": thickness}),
-            },
-        )
-
-        # bottom cap
-        worksheet.conditional_format(
-            first_row + rows_count - 1,
-            first_col,
-            first_row + rows_count - 1,
-            first_col,
-            {
-                "type": "formula",
-                "criteria": "True",
-                "format": workbook.add_format(
-                    {"bottom": thickness, "left": thickness, "right": thickness}
-                ),
-            },
-        )
-
-    else:
-        # top left corner
-        worksheet.conditional_format(
-            first_row,
-            first_col,
-            first_row,
-            first_col,
-            {
-                "type": "formula",
-                "criteria": "True",
-                "format": workbook.add_format({"top": thickness, "left": thickness}),
-            },
-        )
-
-        # top right corner
-        worksheet.conditional_format(
-            first_row,
-            first_col + cols_count - 1,
-            first_row,
-            first_col + cols_count - 1,
-            {
-                "type": "formula",
-                "criteria": "True",
-                "format": workbook.add_format({"top": thickness, "right": thickness}),
-            },
-        )
-
-        # bottom left corner
-        worksheet.conditional_format(
-            first_row + rows_count - 1,
-            first_col,
-            first_row + rows_count - 1,
-            first_col,
-            {
-                "type": "formula",
-                "criteria": "True",
-                "format": workbook.add_format({"bottom": thickness, "left": thickness}),
-            },
-        )
-
-        # bottom right corner
-        worksheet.conditional_format(
-            first_row + rows_count - 1,
-            first_col + cols_count - 1,
-            first_row + rows_count - 1,
-            first_col + cols_count - 1,
-            {
-                "type": "formula",
-                "criteria": "True",
-                "format": workbook.add_format(
-                    {"bottom": thickness, "right": thickness}
-                ),
-            },
-        )
-
-        # top
-        worksheet.conditional_format(
-            first_row,
-            first_col + 1,
-            first_row,
-            first_col + cols_count - 2,
-            {
-                "type": "formula",
-                "criteria": "True",
-                "format": workbook.add_format({"top": thickness}),
-            },
-        )
-
-        # left
-        worksheet.conditional_format(
-            first_row + 1,
-            first_col,
-            first_row + rows_count - 2,
-            first_col,
-            {
-                "type": "formula",
-                "criteria": "True",
-                "format": workbook.add_format({"left": thickness}),
-            },
-        )
-
-        # bottom
-        worksheet.conditional_format(
-            first_row + rows_count - 1,
-            first_col + 1,
-            first_row + rows_count - 1,
-            first_col + cols_count - 2,
-            {
-                "type": "formula",
-                "criteria": "True",
-                "format": workbook.add_format({"bottom": thickness}),
-            },
-        )
-
-        # right
-        worksheet.conditional_format(
-            first_row + 1,
-            first_col + cols_count - 1,
-            first_row + rows_count - 2,
-            first_col + cols_count - 1,
-            {
-                "type": "formula",
-                "criteria": "True",
-                "format": workbook.add_format({"right": thickness}),
-            },
-        )
+    if rows_count <= 0 or cols_count <= 0: # e.g. an empty panel
+        return []
+    parts = _FRAME_PARTS[rows_count == 1, cols_count == 1](
+        first_row, first_col, first_row + rows_count - 1, first_col + cols_count - 1
+    )
+    return [p for p in parts if p[0] <= p[2] and p[1] <= p[3]]
+
+
+def frame_cell_formats(workbook, frames, column_specs=None, thickness=1):
+    """Map (row, col) to a cell format for every cell on the border of one of
+    the (first_row, first_col, rows_count, cols_count) `frames`.
+
+    Write each border cell with its format instead of drawing the frame
+    afterwards. A cell format replaces its column's format, so each border
+    is combined with `column_specs[col]` (a dict of format properties), if
+    given.
+    """
+    column_specs = {} if column_specs is None else column_specs
+    formats = {}
+    for frame in frames:
+        for r1, c1, r2, c2, piece in _frame_parts(*frame):
+            for col in range(c1, c2 + 1):
+                spec = {**column_specs.get(col, {}), **_border_spec(piece, thickness)}
+                fmt = _fmt(workbook, spec)
+                for row in range(r1, r2 + 1):
+                    formats[row, col] = fmt
+    return formats
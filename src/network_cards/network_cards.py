@@ -6,13 +6,27 @@
 # Last Modified: 2022-09-27
 
 import json
+import pickle
 import random
 import pprint
-from collections import OrderedDict
+from types import SimpleNamespace
+from functools import cached_property
+from collections import ChainMap
 import numpy as np
 import pandas as pd
+import scipy.sparse as sp
+from scipy.sparse import csgraph
 import networkx as nx
-from .format_helpers import save_to_buffer, draw_frame_border, tex_escape
+import xlsxwriter
+try:
+    import orjson # optional, faster parsing in read_json
+except ImportError:
+    orjson = None
+try:
+    import ijson # optional, streaming parse in read_json
+except ImportError:
+    ijson = None
+from .format_helpers import save_to_buffer, frame_cell_formats, tex_escape
 
 
 class NetworkCard():
@@ -54,12 +68,21 @@ Largest component's diameter  0
     """
     _null_string = ""
 
-    def __init__(self, graph, initialize=True):
+    def __init__(self, graph, initialize=True, eager=True):
         """Initialize a network card for `graph`.
+
+        The graph is treated as frozen: statistics computed from it are cached
+        and not updated if the graph changes afterwards.
+
+        If `eager` is False, the structure panel is not computed until it is
+        first needed (printing, exporting, or touching D_structr).
         """
         self.graph = graph
+        self._stats_cache = None
+        self._is_directed = graph.is_directed()
         self.D_overall = {}
-        self.D_structr = {}
+        self._D_structr = {}
+        self._structure_pending = False
         self.D_metainf = {}
         self._panel_names = ["Overall", "Structure", "Metainformation"]
 
@@ -68,18 +91,14 @@ Largest component's diameter  0
             self.update_overall(self.label_kind())
             self.update_overall("Nodes are")
             self.update_overall("Links are")
-            if nx.is_weighted(self.graph):
+            if self._is_weighted:
                 self.update_overall("Link weights are")
             self.update_overall("Considerations")
 
-            self.update_structure(self.label_nodes())
-            self.update_structure(self.label_links())
-            if nx.is_directed(self.graph):
-                self.update_structure(self.label_bidirectional_links())
-            self.update_structure(self.label_degree() )
-            self.update_structure(self.label_clustering())
-            self.update_structure(self.label_connected())
-            self.update_structure(self.label_assort())
+            if eager:
+                self._label_structure()
+            else:
+                self._structure_pending = True
 
             self.update_metainfo("Node metadata")
             self.update_metainfo("Link metadata")
@@ -90,11 +109,70 @@ Largest component's diameter  0
             self.update_metainfo("Citation")
             self.update_metainfo("Access")
 
-        self._sizes()
+    @classmethod
+    def _from_dicts(cls, graph, overall, structure, metainfo):
+        """Card for `graph` with the given panel dicts (used as is, not copied)."""
+        card = cls(graph, initialize=False)
+        card.D_overall, card.D_structr, card.D_metainf = overall, structure, metainfo
+        return card
+
+    @cached_property
+    def _is_weighted(self):
+        return nx.is_weighted(self.graph) # scans every link, so only when needed
+
+    def _label_structure(self):
+        """Fill the structure panel with the standard entries."""
+        self.update_structure(self.label_nodes())
+        self.update_structure(self.label_links())
+        if self._is_directed:
+            self.update_structure(self.label_bidirectional_links())
+        self.update_structure(self.label_degree() )
+        self.update_structure(self.label_clustering())
+        self.update_structure(self.label_connected())
+        self.update_structure(self.label_assort())
+
+    @property
+    def D_structr(self):
+        """The structure panel dict, computed now if it was deferred."""
+        if self._structure_pending:
+            self._structure_pending = False
+            self._label_structure()
+        return self._D_structr
+
+    @D_structr.setter
+    def D_structr(self, value):
+        self._D_structr = value
+        self._structure_pending = False
 
     def _str_labeler(self, label, func):
         return {label: func(self.graph)}
 
+    def _has_stats(self):
+        """Whether _stats supports this graph (non-empty, undirected, no
+        multi-links).
+        """
+        return len(self.graph) > 0 and not (self._is_directed or
+                                            self.graph.is_multigraph())
+
+    def _stats(self):
+        """Compute degrees and local clustering of an undirected graph in one
+        pass over its sparse adjacency matrix. Cached; see _has_stats.
+        """
+        if self._stats_cache is None:
+            A = nx.to_scipy_sparse_array(self.graph, weight=None, dtype=int, format='csr')
+            degree = np.asarray(A.sum(axis=1)).ravel() + A.diagonal() # self-loops count twice
+
+            B = A.copy() # clustering ignores self-loops
+            B.setdiag(0)
+            B.eliminate_zeros()
+            k = np.asarray(B.sum(axis=1)).ravel()
+            twice_triangles = np.asarray((B @ B).multiply(B).sum(axis=1)).ravel()
+            with np.errstate(divide='ignore', invalid='ignore'):
+                clustering = np.where(k > 1, twice_triangles / (k * (k - 1)), 0.0)
+
+            self._stats_cache = {'A': A, 'degree': degree, 'clustering': clustering}
+        return self._stats_cache
+
     def label_name(self, unnamed=""):
         """Get entry for network's name. Intended for card's overall panel.
 
@@ -113,7 +191,7 @@ Largest component's diameter  0
         """
         return self._str_labeler("Number of nodes", nx.number_of_nodes)
 
-    def label_connected(self):
+    def label_connected(self, exact=True):
         """Get entries describing whether network is connected. Intended for
         card's structure panel.
 
@@ -126,30 +204,90 @@ Largest component's diameter  0
         For directed networks:
             If strongly connected, report network's diameter. If weakly
             connected or not connected, report as such.
+
+        If `exact` is False, report a faster lower bound on the diameter
+        instead (see _approx_diameter), marked with a footnote.
         """
-        if self.graph.is_directed():
-            return self._label_connected_directed()
-        return self._label_connected_undirected()
+        if self._is_directed:
+            return self._label_connected_directed(exact=exact)
+        return self._label_connected_undirected(exact=exact)
+
+    def _diameter(self, graph, exact=True, rows=None):
+        """Diameter of connected `graph`, or a footnoted lower bound if not
+        `exact`.
 
-    def _label_connected_undirected(self):
+        `rows` are the positions of graph's nodes in the _stats matrix, if
+        any; the lower bound is then found on the matrix directly.
+        """
+        if not exact:
+            if rows is None:
+                approx = self._approx_diameter(graph)
+            else:
+                A = self._stats()['A']
+                if len(rows) < A.shape[0]:
+                    A = A[rows][:, rows]
+                approx = self._approx_diameter_sparse(A)
+            return (approx,
+                    "Approximate (lower bound) from breadth-first searches "
+                    "out of the highest-degree node and the periphery it finds.")
+        # bounding eccentricities is exact and usually needs only a few BFS:
+        return nx.diameter(graph, usebounds=not graph.is_directed())
+
+    def _approx_diameter(self, graph, rim=0.9):
+        """Lower bound on the diameter of connected `graph`: the largest
+        eccentricity among nodes at least `rim` times as far from the
+        highest-degree node as the node farthest from it.
+        """
+        v0 = max(graph.degree, key=lambda kv: kv[1])[0]
+        lengths0 = nx.single_source_shortest_path_length(graph, v0)
+        ecc0 = max(lengths0.values())
+        periphery = [n for n,d in lengths0.items() if d >= rim*ecc0]
+        return max(max(nx.single_source_shortest_path_length(graph, u).values())
+                   for u in periphery)
+
+    def _approx_diameter_sparse(self, A, rim=0.9, chunk=64):
+        """_approx_diameter for a connected graph given as CSR matrix `A`.
+        Searches run `chunk` sources at a time to bound memory.
+        """
+        v0 = np.asarray(A.sum(axis=1)).ravel().argmax()
+        lengths0 = csgraph.shortest_path(A, indices=v0, unweighted=True)
+        periphery = np.flatnonzero(lengths0 >= rim*lengths0.max())
+        return int(max(csgraph.shortest_path(A, indices=periphery[i:i+chunk],
+                                             unweighted=True).max()
+                       for i in range(0, len(periphery), chunk)))
+
+    def _label_connected_undirected(self, exact=True):
         """See label_connected."""
-        ncc = nx.number_connected_components(self.graph)
+        ncc, sizes, largest, rows = self._components()
         if ncc == 1:
-            return {"Connected": "Yes", 'Diameter': nx.diameter(self.graph)}
-        comps = sorted(nx.connected_components(self.graph), key=len, reverse=True)
-        sizes = list(map(len,comps))
+            return {"Connected": "Yes", 'Diameter': self._diameter(self.graph, exact, rows)}
         d = {"Connected":
              f"{ncc} components [{max(sizes)/len(self.graph):.2%} in largest]"
              }
         d.update(self.summarize_distribution(sizes, label='Component size'))
         d['Diameter'] = "n/a" # self._null_string
-        d["Largest component's diameter"] = nx.diameter(self.graph.subgraph(comps[0]))
+        d["Largest component's diameter"] = self._diameter(self.graph.subgraph(largest), exact, rows)
         return d
 
-    def _label_connected_directed(self):
+    def _components(self):
+        """Number of connected components, their sizes, the nodes of a
+        largest one, and their rows in the _stats matrix (None if unused).
+        One pass over the sparse adjacency matrix when _stats supports the
+        graph.
+        """
+        if self._has_stats():
+            ncc, labels = csgraph.connected_components(self._stats()['A'], directed=False)
+            sizes = np.bincount(labels)
+            rows = np.flatnonzero(labels == sizes.argmax())
+            nodes = list(self.graph) # matrix rows follow graph order
+            return ncc, sizes, [nodes[i] for i in rows], rows
+        comps = sorted(nx.connected_components(self.graph), key=len, reverse=True)
+        return len(comps), list(map(len,comps)), comps[0] if comps else [], None
+
+    def _label_connected_directed(self, exact=True):
         """See label_connected."""
         if nx.is_strongly_connected(self.graph):
-            return {"Connected": "Strongly connected", 'Diameter': nx.diameter(self.graph)}
+            return {"Connected": "Strongly connected", 'Diameter': self._diameter(self.graph, exact)}
         if nx.is_weakly_connected(self.graph):
             return {"Connected": "Weakly connected"}
         return {"Connected": "Disconnected"}
@@ -172,8 +310,9 @@ Largest component's diameter  0
         A bidirectional link is one where both (i,j) and (j,i) links exist.
         """
         num_directed_links = self.graph.number_of_edges()
-        undirected_links = {tuple(sorted(ij)) for ij in self.graph.edges()}
-        num_bidirectional_links = num_directed_links - len(undirected_links)
+        A = nx.to_scipy_sparse_array(self.graph, weight=None, format='csr')
+        num_undirected_links = sp.triu(A + A.T).nnz # node pairs with any link
+        num_bidirectional_links = num_directed_links - num_undirected_links
 
         return {"--- Bidirectional links" : f"{100*num_bidirectional_links/num_directed_links:.3g}%" }
 
@@ -186,13 +325,16 @@ Largest component's diameter  0
         If directed, report summary of network's undirected degree
         distribution, in-degree, and out-degree distributions.
         """
-        if self.graph.is_directed():
+        if self._is_directed:
             return self._label_degree_directed()
         return self._label_degree_undirected()
 
     def _label_degree_undirected(self):
         """See label_degree."""
-        degs = [k for _,k in self.graph.degree()]
+        if self._has_stats():
+            degs = self._stats()['degree']
+        else:
+            degs = [k for _,k in self.graph.degree()]
         return self.summarize_distribution(degs, label='Degree')
 
     def _label_degree_directed(self):
@@ -210,13 +352,28 @@ Largest component's diameter  0
         """Get entry for network's degree assortativity. Intended for card's
         structure panel.
         """
-        return self._str_labeler("Assortativity (degree)",
-                                 nx.degree_assortativity_coefficient)
+        if not self._has_stats():
+            return self._str_labeler("Assortativity (degree)",
+                                     nx.degree_assortativity_coefficient)
+
+        # Pearson correlation of the degrees at either end of each link:
+        stats = self._stats()
+        A = stats['A'].tocoo()
+        degree = stats['degree'].astype(float)
+        x, y, w = degree[A.row], degree[A.col], A.data / A.data.sum()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dx, dy = x - w @ x, y - w @ y
+            r = (w @ (dx * dy)) / np.sqrt((w @ dx**2) * (w @ dy**2))
+        return {"Assortativity (degree)": float(r)}
 
     def label_clustering(self):
         """Get entry for network's average clustering. Intended for card's
         structure panel.
         """
+        if self._has_stats():
+            return {"Clustering": float(self._stats()['clustering'].mean())}
+        if self.graph.number_of_edges() < 3 or nx.is_forest(self.graph):
+            return {"Clustering": 0.0} # no triangles possible
         try:
             return self._str_labeler("Clustering", nx.average_clustering)
         except ZeroDivisionError:
@@ -233,11 +390,15 @@ Largest component's diameter  0
         #    attributes.append("bipartite") #
         #if not nx.is_connected(graph):
         #    attributes.append("disconnected")
-        if nx.is_directed(self.graph):
+        if self._is_directed:
             attributes.append('directed')
         else:
             attributes.append('undirected')
-        if nx.is_weighted(self.graph, weight=weight_name):
+        if weight_name == 'weight':
+            weighted = self._is_weighted
+        else:
+            weighted = nx.is_weighted(self.graph, weight=weight_name)
+        if weighted:
             if nx.is_negatively_weighted(self.graph, weight=weight_name):
                 attributes.append("weighted (negatively)")
             else:
@@ -280,7 +441,6 @@ Largest component's diameter  0
         if isinstance(data,str):
             data = {data:self._null_string}
         dest.update(data)
-        self._sizes()
 
     def remove_overall(self, field):
         """Remove a field from network card's overall info panel. No change if
@@ -301,9 +461,8 @@ Largest component's diameter  0
         self._remove(field, self.D_metainf)
 
     def _remove(self, field, dest):
-        """Remove field from dest and update sizes."""
+        """Remove field from dest."""
         dest.pop(field)
-        self._sizes()
 
     def add_footnote(self, field, note):
         """Add footnote to field. This will use the first panel containing
@@ -355,43 +514,20 @@ Largest component's diameter  0
         s = self._series()
 
         # clean up footnotes:
-        fields = list(s['index'])
-        list_notes = list(s[1])
-        new_fields = []
-        num = 1
-        n2num = {}
-        for f,note in zip(fields,list_notes):
-            if note is None: # blanks do nothing
-                new_fields.append(f)
-                continue
-            marks = ""
-            for n in note:
-                try:
-                    marks += f"^{n2num[n]}"
-                except KeyError:
-                    marks += f"^{num}" # do NOT modify first occurrence
-                    n2num[n] = num
-                    num += 1
-            new_fields.append(f + marks)
-        s['index'] = new_fields
-        del s[1]
+        fields, n2num = _number_footnotes(s.index, s.notes, 'txt')
         notes = "\n".join([f"^{num}: {n}" for n, num in n2num.items()])
 
-        txt = s.to_string(float_format='{:.3g}'.format,
+        txt = pd.DataFrame({'index': fields, 0: s.values}).to_string(float_format='{:.3g}'.format,
                           index=False, header=False
                           )
         return "\n\n".join([txt, notes])
 
     def _join_dicts(self):
-        """Return dict joining the overall dict, structure dict, metainf dict,
-        and footnote dict (in order).
+        """Return read-only view joining the overall dict, structure dict, and
+        metainf dict (in order). Maps are listed last-first so iteration order
+        and precedence match updating one dict with each panel in turn.
         """
-        self._sizes()
-        this_dict = {}
-        this_dict.update(self.D_overall)
-        this_dict.update(self.D_structr)
-        this_dict.update(self.D_metainf)
-        return this_dict
+        return ChainMap(self.D_metainf, self.D_structr, self.D_overall)
 
     def summarize_distribution(self, values, label=None):
         """Build string of mean of values and (for now) min and max.
@@ -402,11 +538,14 @@ Largest component's diameter  0
         lbl = f"{label}".strip() # footnote form
 
         if len(values) <= 5:
+            if isinstance(values, np.ndarray):
+                values = values.tolist()
             s = str(list(sorted(values, reverse=True)))
             return {lbl: s}
 
         try:
-            s = f"{np.mean(values):g} [{min(values)}, {max(values)}]"
+            arr = np.asarray(values) # no copy if already an array
+            s = f"{arr.mean():g} [{arr.min().item()}, {arr.max().item()}]"
         except ValueError:
             return {lbl:self._null_string}
         ftext = r"Distributions summarized with average [min, max]."
@@ -414,16 +553,18 @@ Largest component's diameter  0
         return {lbl: (s,ftext)}
 
     def _series(self):
-        """Combine Network Card dicts, convert to pandas series and return."""
-        # put footnotes into their own column
-        D = self._join_dicts()
-        for field,entry in D.items():
+        """Split the combined Network Card dicts into parallel lists of
+        fields, values, and footnotes (None if no footnote), returned as a
+        namespace with attributes index, values, and notes.
+        """
+        index, values, notes = [], [], []
+        for field,entry in self._join_dicts().items():
             if not isinstance(entry, (tuple,list)):
-                D[field] = (entry,)
-        s = pd.Series(D).reset_index()
-        s[1] = s[0].apply(lambda x:x[1:] if len(x)>1 else None)
-        s[0] = s[0].apply(lambda x:x[0])
-        return s
+                entry = (entry,)
+            index.append(field)
+            values.append(entry[0])
+            notes.append(entry[1:] if len(entry)>1 else None)
+        return SimpleNamespace(index=index, values=values, notes=notes)
 
     def clear(self, value="", keep_notes=False):
         """Clear all entries from network card while retaining the fields
@@ -458,13 +599,25 @@ Largest component's diameter  0
                 L.append({'Panel':n, "Field":fl, "Value":va, "Note":ft})
         return pd.DataFrame(L)
 
-    def _sizes(self):
-        self._n_ov_ = len(self.D_overall)
-        self._n_st_ = len(self.D_structr)
-        self._n_mi_ = len(self.D_metainf)
+    @property
+    def _n_ov_(self):
+        return len(self.D_overall)
+
+    @property
+    def _n_st_(self):
+        return len(self.D_structr)
+
+    @property
+    def _n_mi_(self):
+        return len(self.D_metainf)
 
-        self._n_ov_st_    = self._n_ov_ + self._n_st_
-        self._n_ov_st_mi_ = self._n_ov_ + self._n_st_ + self._n_mi_
+    @property
+    def _n_ov_st_(self):
+        return self._n_ov_ + self._n_st_
+
+    @property
+    def _n_ov_st_mi_(self):
+        return self._n_ov_ + self._n_st_ + self._n_mi_
 
     def to_latex(self, buf=None, max_width=None):
         """Save Network Card to LaTeX format. Write to `buf` (or return as string
@@ -475,34 +628,14 @@ Largest component's diameter  0
         s = self._series()
 
         # clean up footnotes:
-        fields = list(s['index'])
-        list_notes = list(s[1])
-        new_fields = []
-        num = 0
-        n2num = {}
-        for f,note in zip(fields,list_notes):
-            if note is None: # blanks do nothing
-                new_fields.append(f)
-                continue
-            marks = []
-            for n in note:
-                try:
-                    marks.append( f"\\textsuperscript{{\\ref{{foot{n2num[n]}}}}}" )
-                except KeyError:
-                    marks.append( f"\\tablefootnote{{\\label{{foot{num}}}{n}}}" ) # do NOT modify first occurrence
-                    n2num[n] = num
-                    num += 1
-            marks = r"\textsuperscript{,}".join(marks) # footnotes 1,2 not 1 2
-            new_fields.append(f + marks)
-        s['index'] = new_fields
-        del s[1]
+        fields, _ = _number_footnotes(s.index, s.notes, 'tex')
 
         column_format = None
         if max_width is not None:
             column_format=f"lp{{{max_width}cm}}"
 
-        s[0] = s[0].apply(tex_escape)
-        ltx = s.style.hide(axis=0).hide(axis=1).format(precision=4).to_latex(hrules=True, column_format=column_format).splitlines()
+        frame = pd.DataFrame({'index': fields, 0: [tex_escape(v) for v in s.values]})
+        ltx = frame.style.hide(axis=0).hide(axis=1).format(precision=4).to_latex(hrules=True, column_format=column_format).splitlines()
         ltx.pop(2) # remove midrule added by pandas to go under (hidden) column names
         ltx.insert(self._n_ov_st_   +2, r'\midrule') # separator before metainfo panel
         ltx.insert(self._n_ov_      +2, r'\midrule') # separator before structure panel
@@ -511,53 +644,42 @@ Largest component's diameter  0
 
     def to_excel(self, filename, formatted=True):
         """Save Network Card to Excel (xlsx) format."""
+        # rows are written in order, so each can be flushed as soon as it's done:
+        with xlsxwriter.Workbook(filename, {'constant_memory': True}) as workbook:
+            self.write_to_xlsxwriter(workbook, formatted=formatted)
+
+    def write_to_xlsxwriter(self, workbook, formatted=True, sheet_name='Sheet1'):
+        """Write Network Card as a new sheet of an open xlsxwriter Workbook.
+        Caller is responsible for closing the workbook.
+        """
         s = self._series()
 
         # clean up footnotes:
-        fields = list(s['index'])
-        list_notes = list(s[1])
-        new_fields = []
-        num = 1
-        n2num = {}
-        for _,(f,note) in enumerate(zip(fields,list_notes)):
-            if note is None: # blanks do nothing
-                new_fields.append(f)
-                continue
-            marks = []
-            for n in note:
-                try:
-                    marks.append( f"{n2num[n]}" )
-                except KeyError:
-                    marks.append( f"{num}" ) # do NOT modify first occurrence
-                    n2num[n] = num
-                    num += 1
-            marks = ",".join(sorted(marks))
-            new_fields.append(f + f" ({marks})" if marks else f)
-        values = list(s[0])
+        new_fields, n2num = _number_footnotes(s.index, s.notes, 'xlsx')
+        values = s.values
         notes = [f"{num}: {n}" for n, num in n2num.items()]
         values.extend([""]*len(notes))
         new_fields.extend(notes)
-        s = pd.Series( dict(zip(new_fields, values)) ).reset_index()
-
-        writer = pd.ExcelWriter(filename, engine='xlsxwriter')
-        s.to_excel(writer, sheet_name='Sheet1', float_format='%.3g',
-                   header=False, index=False)
 
+        worksheet = workbook.add_worksheet(sheet_name)
+        cell_fmts = {}
         if formatted:
-            workbook = writer.book
-            worksheet = writer.sheets['Sheet1']
             worksheet.hide_gridlines(2)
-            label_fmt = workbook.add_format({'text_wrap': False, 'align':'left'})
-            field_fmt = workbook.add_format({'text_wrap': True,  'align':'left'})
-            worksheet.set_column('A:A', 19, label_fmt)
-            worksheet.set_column('B:B', 35, field_fmt)
+            label_spec = {'text_wrap': False, 'align':'left'}
+            field_spec = {'text_wrap': True,  'align':'left'}
+            worksheet.set_column('A:A', 19, workbook.add_format(label_spec))
+            worksheet.set_column('B:B', 35, workbook.add_format(field_spec))
             worksheet.set_zoom(150) # Am I old?
 
-            draw_frame_border(workbook, worksheet, 0,             0, self._n_ov_,2)
-            draw_frame_border(workbook, worksheet, self._n_ov_,   0, self._n_st_,2)
-            draw_frame_border(workbook, worksheet, self._n_ov_st_,0, self._n_mi_,2)
+            frames = [(0,             0, self._n_ov_,2),
+                      (self._n_ov_,   0, self._n_st_,2),
+                      (self._n_ov_st_,0, self._n_mi_,2)]
+            cell_fmts = frame_cell_formats(workbook, frames,
+                                           column_specs={0: label_spec, 1: field_spec})
 
-        writer.save()
+        for row, (field, value) in enumerate(zip(new_fields, values)):
+            worksheet.write(row, 0, field, cell_fmts.get((row, 0)))
+            worksheet.write(row, 1, _excel_value(value), cell_fmts.get((row, 1)))
 
     def to_dict(self):
         """Convert network card to dictionary of dictionaries, one dictionary
@@ -575,6 +697,13 @@ Largest component's diameter  0
         """
         return save_to_buffer( json.dumps(self.to_dict()), buf )
 
+    def to_binary(self, buf=None):
+        """Save network card as pickled bytes of the to_dict() panels: faster
+        to reload than JSON, but not human-readable. Write to `buf` (or return
+        as bytes if buf is None). See read_binary.
+        """
+        return save_to_buffer( pickle.dumps(self.to_dict(), protocol=pickle.HIGHEST_PROTOCOL), buf )
+
     def pprint(self):
         """Pretty-print the dict representation of the network card."""
         pprint.pprint(self.to_dict(), sort_dicts=False)
@@ -587,68 +716,60 @@ class NetworkMultiCard():
         """Combine cards into a Network MultiCard.
         """
         self.num_networks = len(cards)
-        self.D = pd.DataFrame(columns=['Panel', 'Field'])
-        for i,card in enumerate(cards):
-            this_D = card.to_frame()
-            this_D.rename(columns={'Value': f'Value_{i}', 'Note': f"Note_{i}"},
-                          inplace=True)
-            self._merge_onto(this_D)
+        self.D = self._merge_cards(cards)
         self._merge_all_notes()
 
-        # ensure all panels are in right order:
-        D_ov = self.D[self.D['Panel'] == 'Overall']
-        D_st = self.D[self.D['Panel'] == 'Structure']
-        D_mi = self.D[self.D['Panel'] == 'Metainformation']
-        self.D = pd.concat( [D_ov, D_st, D_mi]).reset_index(drop=True)
+    _panel_order = pd.CategoricalDtype(["Overall", "Structure", "Metainformation"],
+                                       ordered=True)
 
-    def _merge_onto(self, frame):
-        """Merge frame into the multicard.
+    def _merge_cards(self, cards):
+        """Stack every card's frame and widen once into Value_i, Note_i columns.
+
+        Rows keep the order fields are first seen across the cards, grouped
+        by panel.
         """
-        self.D = pd.merge(self.D, frame, how='outer', on=["Panel", "Field"])
+        if not cards:
+            return pd.DataFrame(columns=['Panel', 'Field'])
+        big = pd.concat([card.to_frame().assign(card_idx=i)
+                         for i,card in enumerate(cards)], ignore_index=True)
+
+        keys = big[['Panel', 'Field']].drop_duplicates()
+        panel = keys['Panel'].astype(self._panel_order)
+        keys = keys.iloc[panel.argsort(kind='stable')]
+
+        wide = big.set_index(['Panel', 'Field', 'card_idx'])[['Value', 'Note']]
+        wide = wide.unstack('card_idx').reindex(pd.MultiIndex.from_frame(keys))
+        wide.columns = [f"{c}_{i}" for c,i in wide.columns]
+        cols = [f"{c}_{i}" for i in range(len(cards)) for c in ('Value', 'Note')]
+        return wide[cols].reset_index()
 
     def _merge_all_notes(self):
         """Take every separate card's footnote column and merge into a single note column."""
         notes_cols = [c for c in self.D if c.startswith('Note_')]
-        new_notes = []
-        for _, row in self.D[notes_cols].fillna("").iterrows():
-            new_notes.append( set(self._flatten(row.tolist())) -{""} )
+        rows = self.D[notes_cols].fillna("").to_numpy().tolist()
+        new_notes = [set(self._flatten(row)) - {""} for row in rows]
 
         self.D["Note"] = new_notes
         self.D.drop(notes_cols, axis=1, inplace=True)
 
     def _flatten(self, items, seqtypes=(list, tuple)):
-        try:
-            for i, x in enumerate(items):
-                while isinstance(x, seqtypes):
-                    items[i:i+1] = x
-                    x = items[i]
-        except IndexError:
-            pass
-        return items
+        """Flatten nested lists/tuples into one list, depth first."""
+        stack = list(reversed(items))
+        out = []
+        while stack:
+            x = stack.pop()
+            if isinstance(x, seqtypes):
+                stack.extend(reversed(x))
+            else:
+                out.append(x)
+        return out
 
     def __repr__(self):
         show_frame = self.D.drop("Panel", axis=1).fillna(self._null_string)
 
         # clean up footnotes:
-        fields = list(show_frame['Field'])
-        list_notes = list(show_frame['Note'])
-        new_fields = []
-        num = 1
-        n2num = {}
-        for f,note in zip(fields,list_notes):
-            if note is None or note == "": # blanks do nothing
-                new_fields.append(f)
-                continue
-            marks = ""
-            for n in note:
-                try:
-                    marks += f"^{n2num[n]}"
-                except KeyError:
-                    marks += f"^{num}" # do NOT modify first occurrence
-                    n2num[n] = num
-                    num += 1
-            new_fields.append(f + marks)
-        show_frame['Field'] = new_fields
+        show_frame['Field'], n2num = _number_footnotes(show_frame['Field'],
+                                                       show_frame['Note'], 'txt')
         show_frame.drop('Note', axis=1, inplace=True)
         notes = "\n".join([f"^{num}: {n}" for n, num in n2num.items()])
 
@@ -677,9 +798,25 @@ class NetworkMultiCard():
         """Interchange rows at pos1 and pos2 in the multicard. Use show_fields()
         to see row positions to use.
         """
-        idx = self.get_index()
-        idx[pos2], idx[pos1] = idx[pos1], idx[pos2]
-        self.D = self.D.reindex(index=idx).reset_index(drop=True)
+        if self._row_order is None:
+            self._row_order = list(range(len(self._D)))
+        order = self._row_order
+        order[pos2], order[pos1] = order[pos1], order[pos2]
+
+    @property
+    def D(self):
+        """Multicard rows as a DataFrame. Row swaps are applied on first access
+        after swap_two_rows, so chains of swaps reorder the frame only once.
+        """
+        if self._row_order is not None:
+            self._D = self._D.iloc[self._row_order].reset_index(drop=True)
+            self._row_order = None
+        return self._D
+
+    @D.setter
+    def D(self, frame):
+        self._D = frame
+        self._row_order = None
 
     def to_latex(self, buf=None, col_width=2.5):
         """Save MultiCard to LaTeX format. Write to `buf` (or return as string
@@ -691,26 +828,8 @@ class NetworkMultiCard():
         environment.
         """
         show_frame = self.D.drop("Panel", axis=1).fillna(self._null_string)
-        fields = list(show_frame['Field'])
-        list_notes = list(show_frame["Note"])
-        new_fields = []
-        num = 0
-        n2num = {}
-        for f,note in zip(fields,list_notes):
-            if note is None or note == "": # blanks do nothing
-                new_fields.append(f)
-                continue
-            marks = []
-            for n in note:
-                try:
-                    marks.append( f"\\textsuperscript{{\\ref{{foot{n2num[n]}}}}}" )
-                except KeyError:
-                    marks.append( f"\\tablefootnote{{\\label{{foot{num}}}{n}}}" ) # do NOT modify first occurrence
-                    n2num[n] = num
-                    num += 1
-            marks = r"\textsuperscript{,}".join(marks) # footnotes 1,2 not 1 2
-            new_fields.append(f + marks)
-        show_frame['Field'] = new_fields
+        show_frame['Field'], _ = _number_footnotes(show_frame['Field'],
+                                                   show_frame['Note'], 'tex')
         show_frame.drop('Note', axis=1, inplace=True)
 
         for c in show_frame.columns:
@@ -732,88 +851,220 @@ class NetworkMultiCard():
 
     def to_excel(self, filename, formatted=True):
         """Save MultiCard to Excel (xlsx) format."""
-        s = self.D.copy()
+        # rows are written in order, so each can be flushed as soon as it's done:
+        with xlsxwriter.Workbook(filename, {'constant_memory': True}) as workbook:
+            self.write_to_xlsxwriter(workbook, formatted=formatted)
 
+    def write_to_xlsxwriter(self, workbook, formatted=True, sheet_name='Sheet1'):
+        """Write MultiCard as a new sheet of an open xlsxwriter Workbook.
+        Caller is responsible for closing the workbook.
+        """
         # clean up footnotes:
-        fields = list(s['Field'])
-        list_notes = list(s['Note'])
-        new_fields = []
-        num = 1
-        n2num = {}
-        for r,(f,note) in enumerate(zip(fields,list_notes)):
-            if note is None or note == "": # blanks do nothing
-                new_fields.append(f)
-                continue
-            marks = []
-            for n in note:
-                try:
-                    marks.append( f"{n2num[n]}" )
-                except KeyError:
-                    marks.append( f"{num}" ) # do NOT modify first occurrence
-                    n2num[n] = num
-                    num += 1
-            marks = ",".join(sorted(marks))
-            new_fields.append(f + f" ({marks})" if marks else f)
-        notes = [{'Field':f"{num}: {n}"} for n, num in n2num.items()]
-        s['Field'] = new_fields
-        s = pd.concat([s, pd.DataFrame(notes)])
-        s.drop(['Panel','Note'], axis=1, inplace=True)
-
-        writer = pd.ExcelWriter(filename, engine='xlsxwriter')
-        s.to_excel(writer, sheet_name='Sheet1', float_format='%.3g',
-                   header=False, index=False)
+        new_fields, n2num = _number_footnotes(self.D['Field'], self.D['Note'], 'xlsx')
+        value_cols = [c for c in self.D if c.startswith('Value')]
+        rows = self.D[value_cols].to_numpy(dtype=object).tolist()
+        notes = [f"{num}: {n}" for n, num in n2num.items()]
+        new_fields.extend(notes)
+        rows.extend([[]]*len(notes))
 
+        worksheet = workbook.add_worksheet(sheet_name)
+        cell_fmts = {}
         if formatted:
             nov = len(self.D[self.D['Panel']=='Overall'])
             nst = len(self.D[self.D['Panel']=='Structure'])
             nmi = len(self.D[self.D['Panel']=='Metainformation'])
 
-            workbook = writer.book
-            worksheet = writer.sheets['Sheet1']
             worksheet.hide_gridlines(2)
-            label_fmt = workbook.add_format({'text_wrap': False, 'align':'left'})
-            field_fmt = workbook.add_format({'text_wrap': True,  'align':'left'})
-            worksheet.set_column('A:A', 19, label_fmt)
-            worksheet.set_column('B:'+chr(ord("A")+self.num_networks), 30, field_fmt)
+            label_spec = {'text_wrap': False, 'align':'left'}
+            field_spec = {'text_wrap': True,  'align':'left'}
+            worksheet.set_column('A:A', 19, workbook.add_format(label_spec))
+            worksheet.set_column('B:'+chr(ord("A")+self.num_networks), 30,
+                                 workbook.add_format(field_spec))
             worksheet.set_zoom(150) # Am I old?
 
-            draw_frame_border(workbook, worksheet, 0,      0, nov,self.num_networks+1)
-            draw_frame_border(workbook, worksheet, nov,    0, nst,self.num_networks+1)
-            draw_frame_border(workbook, worksheet, nov+nst,0, nmi,self.num_networks+1)
+            frames = [(0,      0, nov,self.num_networks+1),
+                      (nov,    0, nst,self.num_networks+1),
+                      (nov+nst,0, nmi,self.num_networks+1)]
+            column_specs = {c: field_spec for c in range(1, self.num_networks+1)}
+            column_specs[0] = label_spec
+            cell_fmts = frame_cell_formats(workbook, frames, column_specs=column_specs)
+
+        for row, (field, values) in enumerate(zip(new_fields, rows)):
+            worksheet.write(row, 0, field, cell_fmts.get((row, 0)))
+            for col, value in enumerate(values, start=1):
+                worksheet.write(row, col, _excel_value(value), cell_fmts.get((row, col)))
+
+
+def _number_footnotes(fields, notes, style):
+    """Mark each field with its footnotes, numbered in order of first
+    appearance. `style` is 'txt', 'tex' or 'xlsx'; see _FOOTNOTE_STYLES.
+    Fields without notes are left alone.
+
+    Return the marked fields and a {note: num} dict.
+    """
+    first, repeat, join, start = _FOOTNOTE_STYLES[style]
+    new_fields = []
+    n2num = {}
+    for f,note in zip(fields,notes):
+        if not note: # blanks do nothing
+            new_fields.append(f)
+            continue
+        marks = []
+        for n in note:
+            if n in n2num:
+                marks.append(repeat(n, n2num[n]))
+            else:
+                n2num[n] = start + len(n2num)
+                marks.append(first(n, n2num[n])) # do NOT modify first occurrence
+        new_fields.append(f + join(marks))
+    return new_fields, n2num
 
-        writer.save()
 
+def _txt_mark(note, num):
+    return f"^{num}"
 
-def read_json(buf, graph):
-    """Read json serialized network card. Requires graph."""
+
+def _tex_first_mark(note, num):
+    return f"\\tablefootnote{{\\label{{foot{num}}}{note}}}"
+
+
+def _tex_repeat_mark(note, num):
+    return f"\\textsuperscript{{\\ref{{foot{num}}}}}"
+
+
+def _tex_join_marks(marks):
+    return r"\textsuperscript{,}".join(marks) # footnotes 1,2 not 1 2
+
+
+def _xlsx_mark(note, num):
+    return f"{num}"
+
+
+def _xlsx_join_marks(marks):
+    return f" ({','.join(sorted(marks))})"
+
+
+# style: (first(note, num), repeat(note, num), join(marks), first number).
+# `first` and `repeat` mark the first and later appearances of a note.
+_FOOTNOTE_STYLES = {
+    'txt':  (_txt_mark, _txt_mark, "".join, 1),
+    'tex':  (_tex_first_mark, _tex_repeat_mark, _tex_join_marks, 0),
+    'xlsx': (_xlsx_mark, _xlsx_mark, _xlsx_join_marks, 1),
+}
+
+
+def _excel_value(value, float_format='%.3g'):
+    """Coerce a card entry into a value for xlsxwriter, matching what pandas'
+    to_excel(float_format=...) used to write.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        if np.isnan(value):
+            return ""
+        if np.isinf(value): # pandas' inf_rep; xlsxwriter can't write inf
+            return "inf" if value > 0 else "-inf"
+        return float(float_format % value)
+    return value
+
+
+def read_json(buf, graph, stream=False):
+    """Read json serialized network card. Requires graph.
+
+    If `stream` is True, a file `buf` is parsed with ijson as it is read, each
+    panel entry going straight into the card, instead of reading the whole
+    file first (less memory for very large cards, but slower). ijson can't
+    parse the NaN that to_json writes for undefined values, so such a file is
+    re-read in full if it is seekable. Strings are always parsed whole.
+    """
+    if stream and hasattr(buf, "read"):
+        if ijson is None:
+            raise ImportError("read_json(stream=True) requires ijson")
+        start = buf.tell() if buf.seekable() else None
+        try:
+            return NetworkCard._from_dicts(graph, *_stream_panels(buf))
+        except ijson.JSONError:
+            if start is None:
+                raise
+            buf.seek(start)
     try:
         buf = buf.read()
     except AttributeError:
         pass
-    D = json.loads(buf, object_pairs_hook=OrderedDict)
-    Card = NetworkCard(graph, initialize=False)
-    Card.update_overall(D['overall'])
-    Card.update_structure(D['structure'])
-    Card.update_metainfo(D['metainfo'])
+    D = _loads_json(buf)
+    return NetworkCard._from_dicts(graph, D['overall'], D['structure'], D['metainfo'])
+
+
+def _stream_panels(buf):
+    """Fill the overall, structure, and metainfo dicts from ijson parse events
+    on file `buf`, building only one entry at a time.
+    """
+    panels = {'overall': {}, 'structure': {}, 'metainfo': {}}
+    dest = field = builder = None
+    depth = 0
+    for prefix, event, value in ijson.parse(buf, use_float=True):
+        if builder is not None: # inside a list/dict entry (footnoted value)
+            builder.event(event, value)
+            depth += event in ('start_map', 'start_array')
+            depth -= event in ('end_map', 'end_array')
+            if depth == 0:
+                dest[field] = builder.value
+                builder = field = None
+        elif field is not None: # the entry for `field`
+            if event in ('start_map', 'start_array'):
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+                depth = 1
+            else:
+                dest[field] = value
+                field = None
+        elif event == 'map_key' and prefix in panels:
+            dest, field = panels[prefix], value
+    return panels['overall'], panels['structure'], panels['metainfo']
+
+
+def _loads_json(text):
+    """Parse JSON with orjson if installed, else (or for the NaN/Infinity that
+    json.dumps writes, which orjson rejects) with the json module.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(text) # dicts keep key order
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(text)
+
 
-    return Card
+def read_binary(buf, graph):
+    """Read network card saved with to_binary. Requires graph.
+
+    Uses pickle, so only read data you trust.
+    """
+    try:
+        buf = buf.read()
+    except AttributeError:
+        pass
+    D = pickle.loads(buf)
+    return NetworkCard._from_dicts(graph, D['overall'], D['structure'], D['metainfo'])
 
 
 def _align_dicts_ordered(D1, D2, value=""):
-    """Make new dicts with same keys inserted in order of appearance."""
-    keys_both = set(D1.keys()) | set(D2.keys())
-    L1, L2 = list(D1.keys()), list(D2.keys())
+    """Make new dicts with same keys inserted in order of appearance. If the
+    dicts are already aligned, return them as they are.
+    """
+    if list(D1) == list(D2):
+        return D1, D2
+    keys_both = D1.keys() | D2.keys()
+    pos1 = {k:i for i,k in enumerate(D1)}
+    pos2 = {k:i for i,k in enumerate(D2)}
     L = []
     for k in keys_both:
-        try:
-            idx1 = L1.index(k)
-        except ValueError:
-            idx1 = None
-        try:
-            idx2 = L2.index(k)
-        except ValueError:
-            idx2 = None
-        print(k, idx1, idx2)
+        idx1 = pos1.get(k)
+        idx2 = pos2.get(k)
 
         if idx1 is None:
             idx = 2*idx2
@@ -823,22 +1074,10 @@ def _align_dicts_ordered(D1, D2, value=""):
             idx = idx1 + idx2 - 0.5
         L.append( (idx, k))
     L.sort()
-    #for i,k in L:
-    #    print(i,k)
-    #print([k for i,k in L])
     L = [k for i,k in L]
-    print("***")
 
-    D1_new, D2_new = {}, {}
-    for k in L:
-        try:
-            D1_new[k] = D1[k]
-        except KeyError:
-            D1_new[k] = value
-        try:
-            D2_new[k] = D2[k]
-        except KeyError:
-            D2_new[k] = value
+    D1_new = {k: D1.get(k, value) for k in L}
+    D2_new = {k: D2.get(k, value) for k in L}
     return D1_new, D2_new
 
 
@@ -851,12 +1090,11 @@ def align_cards(C1, C2):
     C1.D_structr, C2.D_structr = _align_dicts_ordered(C1.D_structr, C2.D_structr, value=C1._null_string)
     C1.D_metainf, C2.D_metainf = _align_dicts_ordered(C1.D_metainf, C2.D_metainf, value=C1._null_string)
 
-    C1._sizes()
-    C2._sizes()
-
-
-if __name__ == '__main__':
 
+def _demo():
+    """Build a few example cards and a multicard, writing test-card.tex,
+    test-multicard.xlsx, and test-multicard.tex to the working directory.
+    """
     D = nx.DiGraph()
     D.add_edge(0,1)
     D.add_edge(0,2)
@@ -890,3 +1128,15 @@ if __name__ == '__main__':
     NMC.swap_two_rows(4,5)
     NMC.to_excel("test-multicard.xlsx")
     NMC.to_latex("test-multicard.tex")
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Network cards.")
+    parser.add_argument("--demo", action="store_true",
+                        help="build example cards and write test-* files")
+    args = parser.parse_args()
+    if args.demo:
+        _demo()
+    else:
+        parser.print_help()
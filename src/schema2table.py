@@ -1,4 +1,3 @@
-from pytest import PytestUnhandledCoroutineWarning
 #!/usr/bin/env python3
 
 # Jim Bagrow
@@ -11,17 +10,22 @@ import json
 
 SCHEMA_FILE = "schema/v0.0.2/network_card.schema.json"
 
-D = json.load(open(SCHEMA_FILE))
 
+def main():
+    with open(SCHEMA_FILE) as f:
+        D = json.load(f)
 
-print(r"%from schema2table.py")
-print(r"\begin{description}")
-for b in ['overall', 'structure', 'metainfo']:
-    box = D['properties'][b]['properties']
-    print(rf"\item[{b.capitalize()}]")
-    print(r"\begin{description}")
-    for k in box:
-        print(rf"\item[{k}] {box[k]['description']}")
-        #print(k, box[k]['description'])
-    print(r"\end{description}")
-print(r"\end{description}")
+    out = [r"%from schema2table.py", r"\begin{description}"]
+    for b in ['overall', 'structure', 'metainfo']:
+        box = D['properties'][b]['properties']
+        out.append(rf"\item[{b.capitalize()}]")
+        out.append(r"\begin{description}")
+        for k in box:
+            out.append(rf"\item[{k}] {box[k]['description']}")
+        out.append(r"\end{description}")
+    out.append(r"\end{description}")
+    sys.stdout.write("\n".join(out) + "\n")
+
+
+if __name__ == '__main__':
+    main()
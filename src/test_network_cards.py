@@ -5,6 +5,7 @@
 # Jim Bagrow
 # Last Modified: 2022-02-18
 
+import pytest
 import networkx as nx
 import network_cards
 
@@ -35,3 +36,116 @@ def test_graph_degrees2():
     G = nx.Graph()
     G.add_edges_from([(1,2),(1,3)])
     assert network_cards._graph_degrees(G) == [2,1,1]
+
+def test_tex_escape():
+    from network_cards.format_helpers import tex_escape
+    assert tex_escape(r"50% of a_b & {c}") == r"50\% of a\_b \& \{c\}"
+    assert tex_escape("~^\\") == r"\textasciitilde{}\^{}\textbackslash{}"
+    assert tex_escape(3) == 3
+
+def test_frame_parts_tile_perimeter():
+    from network_cards.format_helpers import _frame_parts
+    for rows, cols in [(1,1), (1,4), (4,1), (2,2), (5,2), (5,4)]:
+        cells = [(r,c) for r1,c1,r2,c2,_ in _frame_parts(3, 1, rows, cols)
+                 for r in range(r1,r2+1) for c in range(c1,c2+1)]
+        perimeter = {(r,c) for r in range(3, 3+rows) for c in range(1, 1+cols)
+                     if r in (3, 2+rows) or c in (1, cols)}
+        assert len(cells) == len(set(cells))
+        assert set(cells) == perimeter
+    assert _frame_parts(3, 1, 0, 2) == []
+
+def test_sparse_stats_match_networkx():
+    G = nx.karate_club_graph()
+    G.add_edge(0, 0)
+    card = network_cards.NetworkCard(G)
+    assert abs(card.D_structr["Clustering"] - nx.average_clustering(G)) < 1e-12
+    r = nx.degree_assortativity_coefficient(G)
+    assert abs(card.D_structr["Assortativity (degree)"] - r) < 1e-12
+    assert card._stats()['degree'].tolist() == [k for _, k in G.degree()]
+
+def test_approx_diameter_is_lower_bound():
+    G = nx.barabasi_albert_graph(200, 2, seed=1)
+    card = network_cards.NetworkCard(G, initialize=False)
+    assert card.label_connected()["Diameter"] == nx.diameter(G)
+    value, note = card.label_connected(exact=False)["Diameter"]
+    assert value <= nx.diameter(G)
+
+def test_lazy_structure_matches_eager():
+    G = nx.karate_club_graph()
+    lazy = network_cards.NetworkCard(G, eager=False)
+    lazy.update_metainfo("Ethics", "ok")
+    assert lazy._D_structr == {}
+    eager = network_cards.NetworkCard(G)
+    eager.update_metainfo("Ethics", "ok")
+    assert repr(lazy) == repr(eager)
+
+def test_json_round_trip():
+    G = nx.karate_club_graph()
+    card = network_cards.NetworkCard(G)
+    card.update_metainfo("Ethics", "ok")
+    card.add_footnote("Ethics", "A note")
+    again = network_cards.read_json(card.to_json(), G)
+    assert repr(again) == repr(card)
+
+def test_binary_round_trip(tmp_path):
+    G = nx.karate_club_graph()
+    card = network_cards.NetworkCard(G)
+    card.add_footnote("Clustering", "A note")
+    card.to_binary(tmp_path / "card.pkl")
+    with open(tmp_path / "card.pkl", "rb") as f:
+        again = network_cards.read_binary(f, G)
+    assert repr(again) == repr(card)
+    assert repr(network_cards.read_binary(card.to_binary(), G)) == repr(card)
+
+def test_json_round_trip_nan():
+    G = nx.cycle_graph(8) # regular, so assortativity is NaN
+    card = network_cards.NetworkCard(G)
+    assert "NaN" in card.to_json()
+    again = network_cards.read_json(card.to_json(), G)
+    assert repr(again) == repr(card)
+
+def test_json_stream(tmp_path):
+    pytest.importorskip("ijson")
+    for G in [nx.karate_club_graph(), nx.cycle_graph(8)]: # cycle has NaN
+        card = network_cards.NetworkCard(G)
+        card.add_footnote("Clustering", "A note")
+        card.to_json(tmp_path / "card.json")
+        with open(tmp_path / "card.json", "rb") as f:
+            again = network_cards.read_json(f, G, stream=True)
+        assert repr(again) == repr(card)
+
+def test_multicard_merge_order():
+    def card(overall, structure, metainfo):
+        c = network_cards.NetworkCard(nx.path_graph(3), initialize=False)
+        c.update_overall(overall)
+        c.update_structure(structure)
+        c.update_metainfo(metainfo)
+        return c
+    c1 = card({"A": 1, "B": 2}, {"S1": "x"}, {"M1": "p"})
+    c2 = card({"B": 3, "0": 4}, {"R0": "y", "S1": "z"}, {"M2": "q"})
+    c2.add_footnote("S1", "note")
+    D = network_cards.NetworkMultiCard([c1, c2]).D
+    # fields in order first seen across cards, grouped by panel:
+    assert list(D.columns) == ["Panel", "Field", "Value_0", "Value_1", "Note"]
+    assert list(D["Panel"]) == ["Overall"]*3 + ["Structure"]*2 + ["Metainformation"]*2
+    assert list(D["Field"]) == ["A", "B", "0", "S1", "R0", "M1", "M2"]
+    assert D["Value_0"].fillna("-").tolist() == [1, 2, "-", "x", "-", "p", "-"]
+    assert D["Value_1"].fillna("-").tolist() == ["-", 3, 4, "z", "y", "-", "q"]
+    assert list(D["Note"]) == [set(), set(), set(), {"note"}, set(), set(), set()]
+
+def test_direct_panel_edits_show_in_exports():
+    card = network_cards.NetworkCard(nx.karate_club_graph())
+    repr(card), card.to_latex()
+    card.D_overall['Name'] = 'CHANGED'
+    card.to_dict()['metainfo']['Ethics'] = 'EDITED'
+    for text in [repr(card), card.to_latex()]:
+        assert 'CHANGED' in text and 'EDITED' in text
+
+def test_excel_infinite_values(tmp_path):
+    card = network_cards.NetworkCard(nx.karate_club_graph())
+    card.update_overall('X', float('inf'))
+    card.update_overall('Y', float('-inf'))
+    card.to_excel(tmp_path / "card.xlsx")
+    network_cards.NetworkMultiCard([card, card]).to_excel(tmp_path / "multi.xlsx")
+    assert network_cards.network_cards._excel_value(float('inf')) == "inf"
+    assert network_cards.network_cards._excel_value(float('-inf')) == "-inf"